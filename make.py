@@ -1,158 +1,322 @@
 # File to handle build and installation processes
 import os
-import shutil, subprocess
+import functools, re, shutil, subprocess, sys
+from concurrent.futures import ThreadPoolExecutor
+
+# Directory containing this script
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Banner printed between installation phases
+SEPARATOR = "\n================================\n"
+
+# Directory holding the virtual environment executables
+VENV_BIN = os.path.join("venv", "Scripts" if os.name == 'nt' else "bin")
+VENV_PIP = os.path.join(VENV_BIN, "pip.exe" if os.name == 'nt' else "pip")
+VENV_PYTHON = os.path.join(VENV_BIN, "python.exe" if os.name == 'nt' else "python")
+CARGO_BIN = os.path.expanduser(os.path.join("~", ".cargo", "bin"))
+
+# Tauri application sources
+GUI_DIR = "spotify-downloader-gui"
+
+# npm and npx are batch scripts on Windows and cannot be executed without a shell by their bare name
+NPM = "npm.cmd" if os.name == 'nt' else "npm"
+NPX = "npx.cmd" if os.name == 'nt' else "npx"
+
+# Check whether a command runs successfully, discarding its output
+def has(cmd):
+    try:
+        return subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL).returncode == 0
+    except FileNotFoundError:
+        return False
+
+# Print several status lines with a single write
+# Flushed right away, so the output stays ordered with the output of the child processes
+def print_lines(*lines):
+    sys.stdout.write("\n".join(lines) + "\n")
+    sys.stdout.flush()
 
 # Replace path in a given file
-def replace_path(filename, old_path, new_path):
-    with open(filename, 'r') as file:
+# If mode is given, the rewritten file is created with it, otherwise it keeps the original mode
+def replace_path(filename, old_path, new_path, mode=None):
+    with open(filename, 'rb') as file:
         content = file.read()
-    
+
     # Example: Replace a placeholder with the new path
-    content = content.replace(old_path, new_path)
-    
-    with open(filename, 'w') as file:
+    content = content.replace(old_path.encode(), new_path.encode())
+
+    # Write to a temporary file and swap it in, so the original is never left half written
+    tmp_filename = filename + ".tmp"
+    with open(tmp_filename, 'wb', buffering=1024 * 1024) as file:
         file.write(content)
+    # Set the mode explicitly, so neither the umask nor a stale .tmp file from an
+    # interrupted run can leave the file with different permissions
+    if mode is None:
+        shutil.copymode(filename, tmp_filename)
+    else:
+        os.chmod(tmp_filename, mode)
+    os.replace(tmp_filename, filename)
 
 # Replace path to include current directory
-def add_path():
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-
+def add_path(current_dir=CURRENT_DIR):
     # Replace paths in run-app.sh
     print("Replacing paths in run-app.sh...")
-    replace_path("run-app.sh", '/path/to/Projects/SpotifyDownloader', current_dir)
+    # Written with execute permissions
+    replace_path("run-app.sh", '/path/to/Projects/SpotifyDownloader', current_dir, mode=0o755)
 
     # Replace path in spotify-downloader-sample.desktop
     print("Replacing paths in spotify-downloader-sample.desktop...")
-    replace_path("spotify-downloader-sample.desktop", '/path/to/SpotifyDownloader', current_dir)
+    replace_path("spotify-downloader-sample.desktop", '/path/to/SpotifyDownloader', current_dir, mode=0o755)
 
-# Main function
-def main():
-    print("Starting build and installation process...")
-    
-    # On what platform are we?
-    # Supported platforms: Debian, Arch, Windows, MacOS
-    platform = ""
+# Cached os.uname(), which is not available on Windows
+@functools.cache
+def uname():
+    return os.uname()
+
+# On what platform are we?
+# Supported platforms: Debian, Arch, Windows, MacOS
+# Returns None for unsupported platforms
+@functools.cache
+def detect_platform():
     if os.name == 'nt':
-        platform = "Windows"
-    elif os.uname().sysname == 'Darwin':
-        platform = "MacOS"
-    else:
-        # Check for Debian-based systems
-        if os.path.exists('/etc/debian_version'):
-            platform = "Debian"
-        # Check for Arch-based systems
-        elif os.path.exists('/etc/arch-release'):
-            platform = "Arch"
-        else:
-            print("Unsupported platform. We suggest to install the application manually. Check README.md. Exiting...")
-            return
-    print(f"Detected platform: {platform}")
+        return "Windows"
+    if uname().sysname == 'Darwin':
+        return "MacOS"
+    # Read the distribution ID and the IDs it derives from (e.g. Ubuntu is like debian)
+    try:
+        with open('/etc/os-release', 'rb', buffering=0) as file:
+            os_release = file.read(4096).decode(errors="replace")
+    except FileNotFoundError:
+        os_release = ""
+    distro_ids = set()
+    for value in re.findall(r'^ID(?:_LIKE)?=(.+)$', os_release, re.M):
+        distro_ids.update(value.strip('"\'').split())
+    # Check for Debian-based systems
+    if distro_ids & {"debian", "ubuntu"}:
+        return "Debian"
+    # Check for Arch-based systems
+    if "arch" in distro_ids:
+        return "Arch"
+    return None
+
+# Check the pacman local database for an installed package, without running pacman
+def pacman_installed(package):
+    # Entries are named <package>-<version>-<release>
+    prefix = package + "-"
+    try:
+        with os.scandir("/var/lib/pacman/local") as entries:
+            for entry in entries:
+                if entry.name.startswith(prefix) and entry.name.rsplit("-", 2)[0] == package:
+                    return True
+    except FileNotFoundError:
+        pass
+    return False
 
-    # Check if node is installed, if not, install it
-    if os.system("node -v") != 0:
+# Check if node is installed, if not, queue it for installation
+def check_node(platform, missing):
+    if shutil.which("node") is None:
         print("Node.js is not installed. Installing Node.js...")
-        if platform == "Debian":
-            os.system("sudo apt-get install -y nodejs npm")
-        elif platform == "Arch":
-            os.system("sudo pacman -S --noconfirm nodejs npm")
+        if platform in ["Debian", "Arch"]:
+            missing.extend(["nodejs", "npm"])
         elif platform == "MacOS":
-            os.system("brew install node")
+            missing.append("node")
         elif platform == "Windows":
             print("Please install Node.js manually from https://nodejs.org/")
-            return
+            return False
     else:
         print("Node.js is already installed.")
-        
-    # Check if cargo is installed, if not, install it
-    if os.system("cargo --version") != 0:
+    return True
+
+# Check if cargo is installed, if not, install it
+def install_rust(platform):
+    if shutil.which("cargo") is None and shutil.which("cargo", path=CARGO_BIN) is None:
         print("Cargo is not installed. Installing Rust and Cargo...")
         if platform in ["Debian", "Arch", "MacOS"]:
-            os.system("curl --proto '=https' --tlsv1.2 -sSf https://sh.rustup.rs | sh -s -- -y")
-            os.environ["PATH"] += os.pathsep + os.path.expanduser("~/.cargo/bin")
+            # Pipe the rustup script straight into sh, the same as `curl ... | sh -s -- -y`
+            try:
+                curl = subprocess.Popen(["curl", "--proto", "=https", "--tlsv1.2", "-sSf", "https://sh.rustup.rs"], stdout=subprocess.PIPE)
+            except OSError as e:
+                print(f"Failed to download the Rust installer: {e}")
+                return False
+            try:
+                subprocess.run(["sh", "-s", "--", "-y"], stdin=curl.stdout, check=False)
+            except OSError as e:
+                print(f"Failed to run the Rust installer: {e}")
+                return False
+            finally:
+                curl.stdout.close()
+                curl.wait()
         elif platform == "Windows":
             print("Please install Rust and Cargo manually from https://www.rust-lang.org/tools/install and re-run the installer.")
-            return
-        
-    # Install webkit2GTK if not present
+            return False
+    return True
+
+# Check if webkit2GTK is present, if not, queue it for installation
+def check_webkit(platform, missing):
     print("Checking for webkit2gtk...")
     if platform in ["Debian", "Arch"]:
         installed = False
         if platform == "Debian":
             # Prefer pkg-config check for the development package
-            installed = (os.system("pkg-config --exists webkit2gtk-4.1") == 0)
+            installed = (has(["pkg-config", "--exists", "webkit2gtk-4.1"]))
             # fallback to checking installed package name if needed
             if not installed:
-                installed = (os.system("dpkg -s libwebkit2gtk-4.1-37 > /dev/null 2>&1") == 0)
+                installed = (has(["dpkg", "-s", "libwebkit2gtk-4.1-37"]))
         elif platform == "Arch":
-            installed = (os.system("pacman -Qi webkit2gtk > /dev/null 2>&1") == 0)
+            installed = (pacman_installed("webkit2gtk"))
 
         if installed:
             print("webkit2gtk is already installed.")
         else:
             print("Installing webkit2GTK...")
-            if platform == "Debian":
-                os.system("sudo apt-get install -y libwebkit2gtk-4.1-dev")
-            elif platform == "Arch":
-                os.system("sudo pacman -S --noconfirm webkit2gtk")
+            missing.append("libwebkit2gtk-4.1-dev" if platform == "Debian" else "webkit2gtk")
     elif platform == "MacOS":
         # Homebrew check
-        if os.system("brew list --versions webkit2gtk > /dev/null 2>&1") == 0:
+        if has(["brew", "list", "--versions", "webkit2gtk"]):
             print("webkit2gtk is already installed via Homebrew.")
         else:
             print("Installing webkit2GTK via Homebrew...")
-            os.system("brew install webkit2gtk")
+            missing.append("webkit2gtk")
     elif platform == "Windows":
         print("Please install webkit2GTK manually. Check the README.md for instructions.")
-        return
-    print("\n================================\n")
+        return False
+    return True
+
+# Install every missing system package in a single package manager transaction
+def install_system_packages(platform):
+    missing = []
+    if not (check_node(platform, missing) and check_webkit(platform, missing)):
+        return False
+    if not missing:
+        return True
+
+    try:
+        if platform == "Debian":
+            # Refresh the package lists once, only when something has to be installed
+            subprocess.run(["sudo", "apt-get", "update"], check=False)
+            subprocess.run(["sudo", "apt-get", "install", "-y", *missing], check=False)
+        elif platform == "Arch":
+            subprocess.run(["sudo", "pacman", "-S", "--noconfirm", *missing], check=False)
+        elif platform == "MacOS":
+            subprocess.run(["brew", "install", *missing], check=False)
+    except OSError as e:
+        print(f"Failed to install {' '.join(missing)}: {e}")
+        return False
+    return True
+
+# Environment for the npm and Tauri steps, equivalent to an activated venv with cargo on PATH
+def build_env():
+    env = os.environ.copy()
+    env["VIRTUAL_ENV"] = os.path.abspath("venv")
+    env["PATH"] = os.pathsep.join([os.path.abspath(VENV_BIN), CARGO_BIN, env.get("PATH", "")])
+    env.pop("PYTHONHOME", None)
+    return env
 
-    # Enter or generate environment and install python requirements
+# Install the GUI dependencies once Node.js is available
+# Runs alongside the pip install, since PyPI and the npm registry are independent
+def install_node_modules(platform, env):
+    if not install_system_packages(platform):
+        return False
+    print("Installing the Tauri application dependencies...")
+    # npm ci installs straight from the lockfile without resolving the dependency tree
+    if os.path.exists(os.path.join(GUI_DIR, "package-lock.json")):
+        cmd = [NPM, "ci", "--prefer-offline", "--no-audit", "--no-fund", "--progress=false"]
+    else:
+        cmd = [NPM, "install"]
+    try:
+        returncode = subprocess.run(cmd, cwd=GUI_DIR, env=env, check=False).returncode
+    except OSError as e:
+        print(f"Failed to run npm: {e}")
+        return False
+    if returncode != 0:
+        print("Failed to install the Tauri application dependencies. Exiting...")
+        return False
+    return True
+
+# Enter or generate environment and install python requirements
+def create_venv():
     print("Setting up Python environment and installing requirements...")
-    os.system("python3 -m venv venv")
-    if os.name == 'nt':
-        os.system(".\\venv\\Scripts\\activate && pip install -r requirements.txt")
+    try:
+        subprocess.run(["python3", "-m", "venv", "venv"], check=False)
+    except OSError as e:
+        print(f"Failed to set up the Python environment: {e}")
+        return False
+
+    if not os.path.exists("requirements.txt"):
+        print("No requirements.txt found, skipping the Python requirements.")
+        return True
+
+    # Call the venv's pip directly instead of sourcing the activate script in a shell
+    cmd = [VENV_PIP, "install", "-r", "requirements.txt", "--disable-pip-version-check", "--no-input"]
+    # uv resolves and downloads in parallel, prefer it when available
+    if shutil.which("uv"):
+        cmd = ["uv", "pip", "install", "--python", VENV_PYTHON, "-r", "requirements.txt"]
+    try:
+        returncode = subprocess.run(cmd, check=False).returncode
+    except OSError as e:
+        returncode = None
+        print(f"Failed to run {cmd[0]}: {e}")
+    # Not fatal, the Tauri build does not depend on the Python requirements
+    if returncode != 0:
+        print("Warning: failed to install the Python requirements. Continuing...")
     else:
-        os.system("source ./venv/bin/activate && pip install -r requirements.txt")
-    print("Python environment setup completed.")
-    print("\n================================\n")
+        print("Python environment setup completed.")
+    return True
+
+# Main function
+def main():
+    print("Starting build and installation process...")
     
+    platform = detect_platform()
+    if platform is None:
+        print("Unsupported platform. We suggest to install the application manually. Check README.md. Exiting...")
+        return
+    print(f"Detected platform: {platform}")
+
+    # Expose the venv and cargo executables to npm and Tauri instead of sourcing the activate script
+    env = build_env()
+
+    # Install the independent dependencies concurrently
+    # Node.js and webkit2gtk share the system package manager lock, so they run in the same task,
+    # followed by npm install while pip is still installing the Python requirements
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        futures = [
+            executor.submit(install_node_modules, platform, env),
+            executor.submit(install_rust, platform),
+            executor.submit(create_venv),
+        ]
+    # Leaving the executor waits for every task, check all of them before giving up
+    succeeded = True
+    for future in futures:
+        try:
+            succeeded = future.result() and succeeded
+        except Exception as e:
+            print(f"Installation step failed: {e}")
+            succeeded = False
+    if not succeeded:
+        print("Some installation steps failed. Exiting...")
+        return
     # Build the Tauri application
-    print("Building the Tauri application...")
-    if os.name == 'nt':
-        os.system(".\\venv\\Scripts\\activate && cd spotify-downloader-gui && npm install && npx tauri build")
-    else:
-        os.system("source ./venv/bin/activate && cd spotify-downloader-gui && npm install && npx tauri build")
-    print("Tauri application build completed.")
-    print("\n================================\n")
-    
-    print("Build and installation completed.")
+    print_lines(SEPARATOR, "Building the Tauri application...")
+    if subprocess.run([NPX, "tauri", "build"], cwd=GUI_DIR, env=env, check=False).returncode != 0:
+        print("Tauri application build failed. Exiting...")
+        return
+    print_lines("Tauri application build completed.", SEPARATOR, "Build and installation completed.")
     # Add path to module search
-    add_path()
+    add_path(CURRENT_DIR)
 
     # Rename the desktop file to remove '-sample'
-    os.rename("spotify-downloader-sample.desktop", "spotify-downloader.desktop")
-    print("Renamed desktop file to spotify-downloader.desktop")
-    print("\n================================\n")
-
-    # Give permissions to run-app.sh
-    os.chmod("run-app.sh", 0o755)
-    print("Set execute permissions for run-app.sh")
-    print("\n================================\n")
+    os.replace("spotify-downloader-sample.desktop", "spotify-downloader.desktop")
+    print_lines("Renamed desktop file to spotify-downloader.desktop", SEPARATOR)
 
     # Adding desktop file to applications
     choice = input("Do you want to add the application to your system applications? (y/n): ").strip().lower()
     if choice == 'y':
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        desktop_file_src = os.path.join(current_dir, "spotify-downloader.desktop")
+        desktop_file_src = os.path.join(CURRENT_DIR, "spotify-downloader.desktop")
         home = os.path.expanduser("~")
         user_app_dir = os.path.join(home, ".local", "share", "applications")
 
         if platform in ["Debian", "Arch"]:
-            # make executable, copy to user applications and refresh desktop db
-            try:
-                os.chmod(desktop_file_src, 0o755)
-            except Exception:
-                print("Warning: failed to chmod the desktop file.")
+            # copy the (already executable) desktop file to user applications and refresh desktop db
             os.makedirs(user_app_dir, exist_ok=True)
             shutil.copy2(desktop_file_src, user_app_dir)
             try:
@@ -1,10 +1,179 @@
+import functools
 import subprocess
 import os
-from pathlib import Path
+import re
+import tempfile
 
 # Default download path
 DEFAULT_DOWNLOAD_PATH = "../Music"
 
+# Accepted Spotify URLs, e.g. https://open.spotify.com/track/<id> (optionally with an intl-xx/ segment)
+_URL_RE = re.compile(r"^https?://open\.spotify\.com/(?:intl-[a-z-]+/)?(?:track|album|playlist)/[A-Za-z0-9]+")
+
+# Download directories already created during this session
+_ensured_dirs = set()
+
+# Amount of spotdl output reported for a failed download
+OUTPUT_TAIL_BYTES = 256 * 1024
+
+
+@functools.cache
+def _get_spotdl_settings():
+    """
+    Build the Spotify and downloader settings the same way the spotdl command does:
+    spotdl's defaults, overridden by the user's config file when it has load_config enabled.
+    Raises ImportError when spotdl is not importable from this interpreter.
+
+    Returns:
+        tuple: (spotify_settings, downloader_settings)
+    """
+    from argparse import Namespace
+    from spotdl.utils.config import create_settings
+
+    spotify_settings, downloader_settings, _ = create_settings(Namespace(config=False))
+    return spotify_settings, downloader_settings
+
+
+@functools.cache
+def _get_spotdl():
+    """
+    Create the spotdl client once per session, so the interpreter start and
+    spotdl import are not paid again for every download.
+    Raises ImportError when spotdl is not importable from this interpreter.
+    """
+    import inspect
+    from spotdl import Spotdl
+
+    spotify_settings, downloader_settings = _get_spotdl_settings()
+    # Only pass the Spotify options this spotdl version's client accepts
+    accepted = inspect.signature(Spotdl).parameters
+    # This downloader is only used for searching, keep it from opening a progress display
+    return Spotdl(
+        **{key: value for key, value in spotify_settings.items() if key in accepted},
+        downloader_settings={**downloader_settings, "simple_tui": True}
+    )
+
+
+@functools.cache
+def _init_spotdl_logging():
+    """
+    Show spotdl's log messages, as the spotdl command does.
+    """
+    from spotdl.utils.logging import init_logging
+
+    _, downloader_settings = _get_spotdl_settings()
+    init_logging(downloader_settings["log_level"], downloader_settings["log_format"])
+
+
+@functools.cache
+def _get_downloader(threads, download_path, show_output):
+    """
+    Create a spotdl downloader for the given settings, sharing the client's event loop.
+    Only one Spotify client may exist per process, so downloaders are built separately from it.
+    The user's spotdl config applies, except for the format, thread count and output directory.
+    Progress is always reported as simple log lines rather than rich progress bars, since rich
+    allows only one live display per process; those lines are only shown with show_output.
+    """
+    from spotdl.download.downloader import Downloader
+
+    _, downloader_settings = _get_spotdl_settings()
+    settings = dict(downloader_settings)
+    settings.update({
+        "format": "mp3",
+        "threads": threads,
+        # Relative output templates resolve against the download path, as with cwd=download_path
+        "output": os.path.join(os.path.abspath(download_path), downloader_settings["output"]),
+        "simple_tui": True
+    })
+    if show_output:
+        _init_spotdl_logging()
+
+    return Downloader(settings=settings, loop=_get_spotdl().downloader.loop)
+
+
+def _download_in_process(spotdl, downloader, url):
+    """
+    Download with the spotdl Python API. Raises if any song fails.
+    """
+    songs = spotdl.search([url])
+    if not songs:
+        raise RuntimeError("Download failed: no songs found for this URL")
+
+    results = downloader.download_multiple_songs(songs)
+    failed = sum(1 for _, path in results if path is None)
+    if failed:
+        raise RuntimeError(f"Download failed: {failed} of {len(results)} songs could not be downloaded")
+
+
+def _download_with_cli(url, content_type, threads, download_path, show_output):
+    """
+    Download by running the spotdl command. Raises CalledProcessError on failure.
+    """
+    # Build spotdl command
+    cmd = ["spotdl", "--format", "mp3"]
+
+    # Add threads for playlists and albums
+    if content_type in ['playlist', 'album', '2', '3']:
+        cmd.extend(["--threads", str(threads)])
+
+    cmd.append(url)
+
+    # Run spotdl command
+    # For GUI, don't capture output (much faster!)
+    if show_output:
+        subprocess.run(
+            cmd,
+            cwd=download_path,
+            check=True
+        )
+    else:
+        # spotdl writes its output straight to a temporary file, so long playlists don't pile up in memory
+        # Both streams are kept, since spotdl logs its errors through rich on stdout
+        with tempfile.TemporaryFile() as output:
+            returncode = subprocess.run(
+                cmd,
+                cwd=download_path,
+                stdout=output,
+                stderr=output
+            ).returncode
+            if returncode != 0:
+                # Only read and decode the tail of the output when reporting a failure
+                size = output.seek(0, os.SEEK_END)
+                output.seek(max(0, size - OUTPUT_TAIL_BYTES))
+                raise subprocess.CalledProcessError(
+                    returncode,
+                    cmd,
+                    stderr=output.read().decode(errors="replace")
+                )
+
+
+@functools.lru_cache(maxsize=128)
+def _cached_download(url, content_type, threads, download_path, show_output):
+    """
+    Download the given URL, memoizing successful downloads for the session.
+    Uses the spotdl Python API, falling back to the spotdl command when it can't be imported.
+    Failures raise, so they are not cached and can be retried.
+
+    Returns:
+        tuple: (success, message, error)
+    """
+    # Ensure download directory exists, once per directory
+    real_path = os.path.realpath(download_path)
+    if real_path not in _ensured_dirs:
+        os.makedirs(real_path, exist_ok=True)
+        _ensured_dirs.add(real_path)
+
+    # Only a failure to import spotdl falls back to the command, never a failure mid-download
+    try:
+        spotdl = _get_spotdl()
+        downloader = _get_downloader(threads, download_path, show_output)
+    except ImportError:
+        _download_with_cli(url, content_type, threads, download_path, show_output)
+    else:
+        _download_in_process(spotdl, downloader, url)
+
+    return (True, f"{content_type.capitalize()} downloaded successfully!", None)
+
 
 def download_spotify_content(url, content_type="track", threads=4, download_path=None, show_output=False):
     """
@@ -24,39 +193,11 @@ def download_spotify_content(url, content_type="track", threads=4, download_path
         download_path = DEFAULT_DOWNLOAD_PATH
     
     try:
-        # Ensure download directory exists
-        os.makedirs(download_path, exist_ok=True)
-        
-        # Build spotdl command
-        cmd = ["spotdl", "--format", "mp3"]
-        
-        # Add threads for playlists and albums
-        if content_type in ['playlist', 'album', '2', '3']:
-            cmd.extend(["--threads", str(threads)])
-        
-        cmd.append(url)
-        
-        # Run spotdl command
-        # For GUI, don't capture output (much faster!)
-        if show_output:
-            result = subprocess.run(
-                cmd,
-                cwd=download_path,
-                check=True
-            )
-        else:
-            result = subprocess.run(
-                cmd,
-                cwd=download_path,
-                check=True,
-                capture_output=True,
-                text=True
-            )
-        
+        success, message, error = _cached_download(url, content_type, threads, download_path, show_output)
         return {
-            "success": True,
-            "message": f"{content_type.capitalize()} downloaded successfully!",
-            "error": None
+            "success": success,
+            "message": message,
+            "error": error
         }
         
     except subprocess.CalledProcessError as e:
@@ -89,7 +230,7 @@ def download_spotify_mp3():
     spotify_url = input(f"Enter the Spotify {content_type} URL: ").strip()
 
     # Check for valid input:
-    while not not spotify_url.startswith("https://open.spotify.com/"):
+    while not _URL_RE.match(spotify_url):
         spotify_url = input("Invalid URL. Please enter a valid Spotify URL: ").strip()
 
     if content_type == '1':
@@ -102,16 +243,14 @@ def download_spotify_mp3():
             
     elif content_type in ['2', '3']:
         # For playlists and albums, use spotdl's built-in threading for better performance
-        num_threads = input("Enter number of parallel downloads (default: 4, max recommended: 8): ").strip()
-        if not num_threads or not num_threads.isdigit():
-            num_threads = "4"
-        else:
-            num_threads = str(min(int(num_threads), 16))  # Cap at 16 to avoid issues
+        raw_threads = input("Enter number of parallel downloads (default: 4, max recommended: 8): ").strip()
+        num_threads = int(raw_threads) if raw_threads.isdigit() else 4
+        num_threads = max(1, min(num_threads, 16))  # Cap at 16 to avoid issues
         
         content_name = "playlist" if content_type == '2' else "album"
         print(f"\nDownloading {content_name} as MP3 using {num_threads} parallel threads...")
         
-        result = download_spotify_content(spotify_url, content_name, int(num_threads), DEFAULT_DOWNLOAD_PATH)
+        result = download_spotify_content(spotify_url, content_name, num_threads, DEFAULT_DOWNLOAD_PATH)
         if result["success"]:
             print(f"\n✓ {result['message']}\n")
         else: